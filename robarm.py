@@ -8,16 +8,30 @@
 # https://gist.github.com/maximecb/7fd42439e8a28b9a74a4f7db68281071
 #
 # sudo apt-get install libhidapi-hidraw0 libhidapi-libusb0
-# sudo pip3 install easyhid pynput
+# sudo pip3 install hidapi pynput
+# sudo pip3 install evdev (optional, for -kbd)
+# sudo pip3 install pyusb (optional, for -bulk)
 #
 
 import time
-import easyhid
-import re
 import sys
+import os
+import json
+import socket
+import socketserver
 import struct
+import select
 import termios
+import threading
+import queue
+from collections import deque
 from datetime import datetime, timedelta
+try:
+	import hidraw as hid
+except ImportError:
+	import hid
+
+SOCKPATH = '/tmp/robarm.sock'
 
 def local_echo(enable):
 	iflag, oflag, cflag, lflag, ispeed, ospeed, cc = \
@@ -29,131 +43,391 @@ def local_echo(enable):
 	new_attr = [iflag, oflag, cflag, lflag, ispeed, ospeed, cc]
 	termios.tcsetattr(sys.stdin, termios.TCSANOW, new_attr)
 
+def isint(v):
+	return isinstance(v, int) and not isinstance(v, bool)
+
+class HidDevice():
+	# opens the controller by vid/pid with hidapi, skipping the enumeration
+	# of every HID device on the system
+	def __init__(self, vid, pid):
+		self.dev = hid.device()
+		try:
+			self.dev.open(vid, pid)
+		except (OSError, IOError):
+			raise IOError('No robotic arms found, check for terminators')
+
+	def description(self):
+		return '%s %s' % (self.dev.get_manufacturer_string(),
+			self.dev.get_product_string())
+
+	def write(self, data):
+		# the first byte is the report id, the arm doesn't use them
+		self.dev.write(b'\0' + bytes(data))
+
+	def read(self, timeout_ms=0):
+		# hidapi blocks when timeout_ms is 0 and returns nothing on timeout
+		return bytes(self.dev.read(64, timeout_ms))
+
+	def close(self):
+		self.dev.close()
+
+class UsbBulk():
+	# talks to the controller over bulk endpoints with pyusb instead of
+	# HID interrupt transfers, only usable if the firmware exposes them
+	def __init__(self, dev, intf, epout, epin):
+		self.dev = dev
+		self.intf = intf
+		self.epout = epout
+		self.epin = epin
+
+	@staticmethod
+	def bulkEndpoints(intf):
+		import usb.util
+		epout = epin = None
+		for ep in intf:
+			if usb.util.endpoint_type(ep.bmAttributes) != \
+				usb.util.ENDPOINT_TYPE_BULK:
+				continue
+			if usb.util.endpoint_direction(ep.bEndpointAddress) == \
+				usb.util.ENDPOINT_OUT:
+				epout = ep
+			else:
+				epin = ep
+		return epout, epin
+
+	@classmethod
+	def find(cls, vid, pid):
+		# returns None, with a warning, whenever HID has to be used instead
+		try:
+			import usb.core
+			import usb.util
+		except ImportError:
+			print('WARNING: pyusb is not installed, using HID')
+			return None
+		try:
+			dev = usb.core.find(idVendor=vid, idProduct=pid)
+		except usb.core.NoBackendError:
+			print('WARNING: pyusb has no libusb backend available, using HID')
+			return None
+		if dev is None:
+			print('WARNING: xArm not found through pyusb, using HID')
+			return None
+		# look through the cached descriptors first, this doesn't open the
+		# device so it works without access to /dev/bus/usb
+		found = None
+		for cfg in dev.configurations():
+			for intf in cfg:
+				epout, epin = cls.bulkEndpoints(intf)
+				if epout is not None and epin is not None:
+					found = (cfg, intf, epout, epin)
+					break
+			if found:
+				break
+		if not found:
+			print('WARNING: xArm has no bulk endpoints, using HID')
+			return None
+		cfg, intf, epout, epin = found
+		num = intf.bInterfaceNumber
+		try:
+			try:
+				active = dev.get_active_configuration()
+			except usb.core.USBError:
+				active = None
+			if active is None or \
+				active.bConfigurationValue != cfg.bConfigurationValue:
+				dev.set_configuration(cfg.bConfigurationValue)
+			if dev.is_kernel_driver_active(num):
+				dev.detach_kernel_driver(num)
+			usb.util.claim_interface(dev, num)
+		except usb.core.USBError as e:
+			print('WARNING: cannot claim the xArm bulk interface (%s), using HID' % e)
+			return None
+		return cls(dev, num, epout, epin)
+
+	def description(self):
+		return 'USB bulk %04x:%04x interface %d' % \
+			(self.dev.idVendor, self.dev.idProduct, self.intf)
+
+	def write(self, data):
+		self.epout.write(data)
+
+	def read(self, timeout_ms=0):
+		import usb.core
+		try:
+			return bytes(self.epin.read(self.epin.wMaxPacketSize, timeout_ms))
+		except usb.core.USBTimeoutError:
+			return b''
+
+	def close(self):
+		import usb.util
+		usb.util.release_interface(self.dev, self.intf)
+		usb.util.dispose_resources(self.dev)
+
 class XArm():
 	dev = None
 	verbose = False
+	writer = None
+	vid = 0x0483
+	pid = 0x5750
 	sn = ['claw', 'wristroll', 'wristpitch', 'elbow', 'shoulder', 'base']
-	servoinfo = [
-		{'id': 1, 'name': sn[0], 'min': 1310, 'mid': 1500, 'max': 2500, 'pos': -1},
-		{'id': 2, 'name': sn[1], 'min': 400,  'mid': 1430, 'max': 2600, 'pos': -1},
-		{'id': 3, 'name': sn[2], 'min': 500,  'mid': 1500, 'max': 2500, 'pos': -1},
-		{'id': 4, 'name': sn[3], 'min': 400,  'mid': 1670, 'max': 2600, 'pos': -1},
-		{'id': 5, 'name': sn[4], 'min': 400,  'mid': 1480, 'max': 2600, 'pos': -1},
-		{'id': 6, 'name': sn[5], 'min': 400,  'mid': 1570, 'max': 2600, 'pos': -1},
-	]
-	def __init__(self, verbose=False):
+	# per-servo limits, stored as parallel lists indexed by servo index
+	servoid = [1, 2, 3, 4, 5, 6]
+	posmin  = [1310, 400,  500,  400,  400,  400]
+	posmid  = [1500, 1430, 1500, 1670, 1480, 1570]
+	posmax  = [2500, 2600, 2500, 2600, 2600, 2600]
+	resttime = 1500
+	resttol = 20
+	restreadms = 100
+	# longest wait for a reply, so a lost one can't hang the daemon
+	readms = 500
+	# fixed command packets
+	offpkt = bytes([0x55, 0x55, 9, 20, 6, 1, 2, 3, 4, 5, 6])
+	readpkt = bytes([
+		0x55, 0x55,
+		9,  # Len
+		21, # Cmd
+		6,  # Count
+		1,
+		2,
+		3,
+		4,
+		5,
+		6
+	])
+	batterypkt = bytes([0x55, 0x55, 2, 15])
+	# read_pos reply body, six (id, pos) pairs after the 5 byte header
+	posreply = struct.Struct('<' + 'BH'*6)
+	def __init__(self, verbose=False, bulk=False):
 		self.verbose = verbose
-		en = easyhid.Enumeration()
-		devices = en.find(vid=0x0483, pid=0x5750)
-
-		if self.verbose:
-			for dev in devices:
-				print(dev.description())
-
-		if len(devices) < 1:
-			print('ERROR: No robotic arms found, check for terminators')
-			sys.exit(1)
-
-		self.dev = devices[0]
-		self.dev.open()
+		self.pos = [-1] * len(self.sn)
+		# servos holding their commanded position, cleared by servos_off
+		self.holding = [False] * len(self.sn)
+		# read_pos results are reused for posttl seconds unless a move is sent
+		self.poscache = None
+		self.poscachets = 0
+		self.posttl = 0.02
+		self.poslimit = {'min': self.posmin, 'mid': self.posmid, 'max': self.posmax}
+		# servo lookup by name, numeric string, or number
+		self.servomap = {name: i for i, name in enumerate(self.sn)}
+		self.servomap.update({str(i+1): i for i in range(len(self.sn))})
+		self.servomap.update({i+1: i for i in range(len(self.sn))})
+		# prebuilt move packets, only time and position are filled per call
+		self.movepkt = [bytearray([0x55, 0x55, 8, 0x03, 1, 0, 0, id, 0, 0])
+			for id in self.servoid]
+		self.allpkt = bytearray([0x55, 0x55, 3 + 3*6 + 2, 0x03, 6, 0, 0])
+		for id in self.servoid:
+			self.allpkt += bytearray([id, 0, 0])
+		# move_all packs (time, id1, pos1, ... id6, pos6) in one call
+		self.allstruct = struct.Struct('<H' + 'BH'*6)
+		self.allargs = [0]
+		for id in self.servoid:
+			self.allargs += [id, 0]
+		# the rest pose never changes, so its packet is built once
+		args = list(self.allargs)
+		args[0] = self.resttime
+		args[2::2] = self.posmid
+		self.restpkt = bytes(self.allpkt[:5]) + self.allstruct.pack(*args)
+		if bulk:
+			self.dev = UsbBulk.find(self.vid, self.pid)
+			if self.dev:
+				if self.verbose:
+					print(self.dev.description())
+				return
+
+		self.dev = HidDevice(self.vid, self.pid)
 		if self.verbose:
+			print(self.dev.description())
 			print('Connected to xArm device')
 
 	def __del__(self):
+		self.stopWriter()
 		if self.verbose:
 			print('Closing xArm device')
 		if self.dev:
 			self.dev.close()
-		local_echo(True)
 
-	def itos(self, v):
-		lsb = v & 0xFF
-		msb = v >> 8
-		return lsb, msb
+	def startWriter(self):
+		# send commands from a background thread so callers don't wait on
+		# the USB write, replies are only read once the queue has drained
+		if self.writer:
+			return
+		self.wqueue = queue.Queue()
+		self.writer = threading.Thread(target=self.writeLoop, daemon=True)
+		self.writer.start()
+
+	def stopWriter(self):
+		if not self.writer:
+			return
+		self.wqueue.put(None)
+		self.writer.join()
+		self.writer = None
+
+	def writeLoop(self):
+		while True:
+			buf = self.wqueue.get()
+			if buf is None:
+				self.wqueue.task_done()
+				break
+			try:
+				self.dev.write(buf)
+			except Exception as e:
+				print('ERROR: xArm write failed: %s' % e)
+				# the move may not have happened, let the next one through
+				self.holding = [False] * len(self.sn)
+			self.wqueue.task_done()
+
+	def write(self, buf):
+		if self.writer:
+			# the packet templates are reused, so queue a copy
+			self.wqueue.put(bytes(buf))
+		else:
+			try:
+				self.dev.write(buf)
+			except Exception:
+				self.holding = [False] * len(self.sn)
+				raise
+
+	def drain(self):
+		if self.writer:
+			self.wqueue.join()
 
 	def servoIndex(self, id):
-		s = -1
-		if isinstance(id, str):
-			if re.match('^[0-9]*$', id):
-				s = int(id) - 1
-			elif id in self.sn:
-				s = self.sn.index(id)
-		elif isinstance(id, int):
-			s = id - 1
-		if s < 0 or s >= len(self.sn):
-			print('ERROR: %s is not a valid servo' % id)
-			sys.exit(1)
+		s = self.servomap.get(id)
+		if s is None:
+			raise ValueError('%s is not a valid servo' % id)
 		return s
 
 	def servoInfo(self, id):
-		return self.servoinfo[self.servoIndex(id)]
+		i = self.servoIndex(id)
+		return {'id': self.servoid[i], 'name': self.sn[i], 'min': self.posmin[i],
+			'mid': self.posmid[i], 'max': self.posmax[i], 'pos': self.pos[i]}
 
-	def clipPos(self, info, pos):
-		if pos < info['min']:
-			return info['min']
-		elif pos > info['max']:
-			return info['max']
-		return pos
+	def clipPos(self, i, pos):
+		return max(self.posmin[i], min(self.posmax[i], pos))
 
-	def moveTo(self, id, pos, time=0):
-		s = self.servoInfo(id)
+	def parsePos(self, i, pos):
 		if isinstance(pos, str):
-			if pos in ['min', 'mid', 'max']:
-				pos = s[pos]
-			elif re.match('^[0-9]*$', pos):
+			if pos in self.poslimit:
+				pos = self.poslimit[pos][i]
+			elif pos.isdecimal():
 				pos = int(pos)
-			else:
-				print('ERROR: %s is not a valid position' % pos)
-				sys.exit(1)
-		s['pos'] = self.clipPos(s, pos)
-		t_lsb, t_msb = self.itos(time)
-		p_lsb, p_msb = self.itos(s['pos'])
-		self.dev.write([0x55, 0x55, 8, 0x03, 1, t_lsb, t_msb, s['id'], p_lsb, p_msb])
+		if not isint(pos):
+			raise ValueError('%s is not a valid position' % (pos,))
+		return pos
+
+	def checkTime(self, time):
+		if not isint(time) or time < 0 or time > 0xFFFF:
+			raise ValueError('%s is not a valid move time' % (time,))
+		return time
+
+	def checkDelta(self, dpos):
+		if not isint(dpos):
+			raise ValueError('%s is not a valid relative move' % (dpos,))
+		return dpos
+
+	def moveTo(self, id, pos, time=0):
+		i = self.servoIndex(id)
+		pos = self.clipPos(i, self.parsePos(i, pos))
+		self.checkTime(time)
+		if self.holding[i] and pos == self.pos[i]:
+			return
+		buf = self.movepkt[i]
+		struct.pack_into('<H', buf, 5, time)
+		struct.pack_into('<H', buf, 8, pos)
+		self.pos[i] = pos
+		self.holding[i] = True
+		self.poscache = None
+		self.write(buf)
 
 	def moveRel(self, id, dpos, time=0):
-		s = self.servoInfo(id)
-		if s['pos'] < 0:
+		i = self.servoIndex(id)
+		self.checkDelta(dpos)
+		self.checkTime(time)
+		if self.pos[i] < 0:
+			return
+		pos = self.clipPos(i, self.pos[i] + dpos)
+		if self.holding[i] and pos == self.pos[i]:
 			return
-		s['pos'] = self.clipPos(s, s['pos'] + dpos)
-		t_lsb, t_msb = self.itos(time)
-		p_lsb, p_msb = self.itos(s['pos'])
-		self.dev.write([0x55, 0x55, 8, 0x03, 1, t_lsb, t_msb, s['id'], p_lsb, p_msb])
+		buf = self.movepkt[i]
+		struct.pack_into('<H', buf, 5, time)
+		struct.pack_into('<H', buf, 8, pos)
+		self.pos[i] = pos
+		self.holding[i] = True
+		self.poscache = None
+		self.write(buf)
 
 	def move_all(self, poss, time=0):
-		for i in range(6):
-			self.moveTo(id=i+1, pos=poss[i], time=time)
+		# one multi-servo packet instead of six single-servo writes
+		if len(poss) != len(self.sn):
+			raise ValueError('move_all needs %d positions, not %d' %
+				(len(self.sn), len(poss)))
+		self.checkTime(time)
+		# clip all six positions against the limit lists in one pass
+		poss = list(map(min, self.posmax,
+			map(max, self.posmin, map(self.parsePos, range(6), poss))))
+		if all(self.holding) and poss == self.pos:
+			return
+		args = self.allargs
+		args[0] = time
+		args[2::2] = poss
+		self.allstruct.pack_into(self.allpkt, 5, *args)
+		self.pos = poss
+		self.holding = [True] * 6
+		self.poscache = None
+		self.write(self.allpkt)
+
+	def moveRelBatch(self, deltas, time=0):
+		# move several servos relative to their positions in one packet,
+		# every entry is checked before any state changes
+		self.checkTime(time)
+		moves = [(self.servoIndex(id), self.checkDelta(dpos))
+			for id, dpos in deltas.items()]
+		newpos = {}
+		for i, dpos in moves:
+			if self.pos[i] < 0:
+				continue
+			newpos[i] = self.clipPos(i, newpos.get(i, self.pos[i]) + dpos)
+		idx = [i for i in newpos
+			if not (self.holding[i] and newpos[i] == self.pos[i])]
+		if not idx:
+			return
+		buf = bytearray([0x55, 0x55, 3 + 3*len(idx) + 2, 0x03, len(idx)])
+		buf += struct.pack('<H', time)
+		for i in idx:
+			buf += struct.pack('<BH', self.servoid[i], newpos[i])
+		for i in idx:
+			self.pos[i] = newpos[i]
+			self.holding[i] = True
+		self.poscache = None
+		self.write(buf)
 
 	def servos_off(self):
-		self.dev.write([0x55, 0x55, 9, 20, 6, 1, 2, 3, 4, 5, 6])
-
-	def read_pos(self):
-		self.dev.write([
-			0x55, 0x55,
-			9,  # Len
-			21, # Cmd
-			6,  # Count
-			1,
-			2,
-			3,
-			4,
-			5,
-			6
-		])
-		ret = self.dev.read()
-		count = ret[4]
-		assert count == 6
-		poss = []
-		for i in range(6):
-			id = ret[5 + 3*i]
-			p_lsb = ret[5 + 3*i + 1]
-			p_msb = ret[5 + 3*i + 2]
-			pos = (p_msb << 8) + p_lsb
-			poss.append(pos)
-		return poss
+		self.holding = [False] * len(self.sn)
+		self.poscache = None
+		self.write(self.offpkt)
+
+	def read_pos(self, timeout_ms=None):
+		now = time.monotonic()
+		if self.poscache is not None and now - self.poscachets < self.posttl:
+			return list(self.poscache)
+		self.drain()
+		self.dev.write(self.readpkt)
+		ret = self.dev.read(self.readms if timeout_ms is None else timeout_ms)
+		if not ret:
+			raise IOError('no servo position reply from xArm')
+		if len(ret) < 5 + self.posreply.size or ret[4] != 6:
+			raise IOError('bad servo position reply from xArm')
+		poss = list(self.posreply.unpack_from(ret, 5)[1::2])
+		self.poscache = poss
+		self.poscachets = now
+		return list(poss)
 
 	def getBattery(self):
-		self.dev.write([0x55, 0x55, 2, 15])
-		ret = self.dev.read()
+		self.drain()
+		self.dev.write(self.batterypkt)
+		ret = self.dev.read(self.readms)
+		if not ret:
+			raise IOError('no battery reply from xArm')
 		try:
 			out = struct.unpack('H', ret[4:6])
 		except:
@@ -161,46 +435,142 @@ class XArm():
 		return out[0]
 
 	def rest(self):
-		self.move_all([
-			self.servoinfo[0]['mid'],
-			self.servoinfo[1]['mid'],
-			self.servoinfo[2]['mid'],
-			self.servoinfo[3]['mid'],
-			self.servoinfo[4]['mid'],
-			self.servoinfo[5]['mid']
-		], time=1500)
-		time.sleep(2)
+		self.pos = list(self.posmid)
+		self.holding = [True] * len(self.sn)
+		self.poscache = None
+		self.write(self.restpkt)
+		# wait out the move, then check the servos got there before letting
+		# go, a missing or bad reply just ends the wait
+		time.sleep(self.resttime / 1000 + 0.05)
+		for i in range(5):
+			try:
+				poss = self.read_pos(self.restreadms)
+			except IOError:
+				break
+			if all(abs(p - m) < self.resttol for p, m in zip(poss, self.posmid)):
+				break
+			time.sleep(0.05)
 		self.servos_off()
 
 
+# keys as KeyControl sees them, printable keys are just their character
+KEY_ESC = 'esc'
+KEY_SPACE = 'space'
+KEY_LEFT = 'left'
+KEY_RIGHT = 'right'
+KEY_UP = 'up'
+KEY_DOWN = 'down'
+
+class EvdevEvents():
+	# reads a keyboard straight from /dev/input instead of going through
+	# the X event queue, works the same as pynput's Events queue but the
+	# keys come out as the KEY_* names above, so pynput isn't needed
+	class Press():
+		def __init__(self, key):
+			self.key = key
+
+	class Release():
+		def __init__(self, key):
+			self.key = key
+
+	def __init__(self, path):
+		import evdev
+		self.EV_KEY = evdev.ecodes.EV_KEY
+		self.dev = evdev.InputDevice(path)
+		self.queue = deque()
+		e = evdev.ecodes
+		self.keymap = {
+			e.KEY_ESC: KEY_ESC, e.KEY_SPACE: KEY_SPACE,
+			e.KEY_LEFT: KEY_LEFT, e.KEY_RIGHT: KEY_RIGHT,
+			e.KEY_UP: KEY_UP, e.KEY_DOWN: KEY_DOWN,
+		}
+		for c in '123456qx':
+			self.keymap[getattr(e, 'KEY_' + c.upper())] = c
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.dev.close()
+
+	def get(self, timeout):
+		deadline = time.monotonic() + timeout
+		while not self.queue:
+			wait = deadline - time.monotonic()
+			if wait <= 0 or not select.select([self.dev], [], [], wait)[0]:
+				return None
+			for event in self.dev.read():
+				key = self.keymap.get(event.code)
+				if event.type != self.EV_KEY or key is None:
+					continue
+				# value is 1 for press, 2 for autorepeat, 0 for release
+				if event.value > 0:
+					self.queue.append(self.Press(key))
+				else:
+					self.queue.append(self.Release(key))
+		return self.queue.popleft()
+
 class KeyControl():
 	arm = None
 	servosel = 6
 	last = 0
 	lastkey = 0
-	def __init__(self, armobj):
+	flushrate = 0.02
+	def __init__(self, armobj, kbd=None):
 		self.arm = armobj
+		self.kbd = kbd
 		self.last = datetime.now()
+		# relative moves are queued per servo and sent as one packet
+		self.pending = {}
 
 	def run(self):
 		self.arm.rest()
 		local_echo(False)
-		print('Robot Arm Ready')
-		with Listener(on_press=self.on_press, on_release=self.on_release) as listener:
-			listener.join()
+		try:
+			print('Robot Arm Ready')
+			if self.kbd:
+				events = EvdevEvents(self.kbd)
+			else:
+				from pynput.keyboard import Events
+				events = Events()
+			# wait at most flushrate for a key so pending moves always go out
+			lastflush = time.monotonic()
+			with events:
+				while True:
+					event = events.get(self.flushrate)
+					if isinstance(event, events.Press) and \
+						not self.on_press(self.keyname(event.key)):
+						break
+					now = time.monotonic()
+					if now - lastflush >= self.flushrate:
+						self.flush()
+						lastflush = now
+			self.flush()
+		finally:
+			local_echo(True)
 		print('Robot Arm Off')
 
+	def queueRel(self, id, dpos):
+		self.pending[id] = self.pending.get(id, 0) + dpos
+
+	def flush(self):
+		if self.pending:
+			self.arm.moveRelBatch(self.pending, 100)
+			self.pending = {}
+
+	def keyname(self, key):
+		# evdev keys are already names, pynput keys give their character
+		# or their Key name, which matches the KEY_* constants
+		if isinstance(key, str):
+			return key
+		return getattr(key, 'char', None) or getattr(key, 'name', None)
+
 	def iskey(self, key, chars):
-		try:
-			if key.char in chars:
-				return True
-		except:
-			pass
-		return False
+		return key in chars
 
 	def on_press(self, key):
 		# exit keys
-		if key == Key.esc or self.iskey(key, ['q', 'x']):
+		if key == KEY_ESC or self.iskey(key, ['q', 'x']):
 			return False
 
 		# limit keypresses to 10 per second
@@ -212,27 +582,110 @@ class KeyControl():
 
 		# process the keys
 		if self.iskey(key, ['1', '2', '3', '4', '5', '6']):
-			self.servosel = int(key.char)
+			self.servosel = int(key)
 			return True
 		if self.servosel > 0:
 			delta = 100 if dt < 0.1 and key == self.lastkey else 20
-			if key == Key.left or key == Key.down:
+			if key == KEY_LEFT or key == KEY_DOWN:
 				if self.servosel in [3,4,6]:
-					self.arm.moveRel(self.servosel, delta, 100)
+					self.queueRel(self.servosel, delta)
 				else:
-					self.arm.moveRel(self.servosel, -1 * delta, 100)
-			elif key == Key.right or key == Key.up:
+					self.queueRel(self.servosel, -1 * delta)
+			elif key == KEY_RIGHT or key == KEY_UP:
 				if self.servosel in [3,4,6]:
-					self.arm.moveRel(self.servosel, -1 * delta, 100)
+					self.queueRel(self.servosel, -1 * delta)
 				else:
-					self.arm.moveRel(self.servosel, delta, 100)
-			elif key == Key.space:
+					self.queueRel(self.servosel, delta)
+			elif key == KEY_SPACE:
+				self.pending.pop(self.servosel, None)
 				self.arm.moveTo(self.servosel, 'mid', 500)
 			self.lastkey = key
 		return True
 
-	def on_release(self, key):
-		return True
+class ArmServer(socketserver.StreamRequestHandler):
+	# daemon side: runs one JSON line command at a time on the shared XArm
+	ops = [
+		'moveTo', 'moveRel', 'moveRelBatch', 'move_all', 'servos_off',
+		'read_pos', 'getBattery', 'rest', 'servoInfo',
+	]
+	def handle(self):
+		for line in self.rfile:
+			reply = self.command(line)
+			self.wfile.write((json.dumps(reply) + '\n').encode())
+
+	def command(self, line):
+		# any failure becomes an error reply so the connection stays up
+		try:
+			req = json.loads(line)
+		except ValueError as e:
+			# JSONDecodeError or UnicodeDecodeError
+			return {'error': 'bad request: %s' % e}
+		if not isinstance(req, dict) or req.get('op') not in self.ops:
+			return {'error': '%s is not a valid command' %
+				line.decode(errors='replace').strip()}
+		func = getattr(self.server.arm, req['op'])
+		try:
+			with self.server.lock:
+				return {'ret': func(*req.get('args', []))}
+		except (ValueError, IOError) as e:
+			return {'error': str(e)}
+		except Exception as e:
+			return {'error': '%s failed: %s: %s' % (req['op'], type(e).__name__, e)}
+
+class ArmClient():
+	# client side: forwards XArm calls to a running daemon
+	def __init__(self, sock):
+		self.sock = sock
+		self.rfile = sock.makefile('rb')
+
+	@classmethod
+	def connect(cls, path=SOCKPATH):
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			sock.connect(path)
+		except OSError:
+			sock.close()
+			return None
+		return cls(sock)
+
+	def call(self, op, *args):
+		req = json.dumps({'op': op, 'args': args}) + '\n'
+		try:
+			self.sock.sendall(req.encode())
+			line = self.rfile.readline()
+		except OSError:
+			line = b''
+		if not line:
+			raise IOError('robarm daemon closed the connection')
+		reply = json.loads(line)
+		if 'error' in reply:
+			raise ValueError(reply['error'])
+		return reply['ret']
+
+	def __getattr__(self, name):
+		if name not in ArmServer.ops:
+			raise AttributeError(name)
+		return lambda *args: self.call(name, *args)
+
+def run_daemon(verbose, bulk):
+	if ArmClient.connect():
+		print('ERROR: robarm daemon is already running on %s' % SOCKPATH)
+		sys.exit(1)
+	if os.path.exists(SOCKPATH):
+		os.unlink(SOCKPATH)
+	arm = XArm(verbose, bulk)
+	arm.startWriter()
+	server = socketserver.ThreadingUnixStreamServer(SOCKPATH, ArmServer)
+	server.daemon_threads = True
+	server.arm = arm
+	server.lock = threading.Lock()
+	print('Robot Arm daemon listening on %s' % SOCKPATH)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+	os.unlink(SOCKPATH)
 
 if __name__ == '__main__':
 	import argparse
@@ -248,29 +701,51 @@ if __name__ == '__main__':
 		help='try to read the servo positions')
 	parser.add_argument('-battery', action='store_true',
 		help='read the battery voltage')
+	parser.add_argument('-bulk', action='store_true',
+		help='use USB bulk endpoints instead of HID if the arm has them')
 	parser.add_argument('-control', action='store_true',
 		help='Keyboard control. First type 1-6 to select a servo, then left/right or up/down to move. Hold key for fast move.')
+	parser.add_argument('-daemon', action='store_true',
+		help='keep the arm open and serve other robarm.py calls on %s' % SOCKPATH)
+	parser.add_argument('-kbd', metavar='device',
+		help='read -control keys directly from an evdev keyboard, e.g. /dev/input/by-id/...-kbd')
 	args = parser.parse_args()
 
 	if len(sys.argv) < 2:
 		parser.print_help()
 		sys.exit(1)
 
-	arm = XArm(args.verbose)
-	if args.control:
-		from pynput.keyboard import KeyCode, Key, Listener
-		keycont = KeyControl(arm)
-		keycont.run()
-
-	if args.reset:
-		arm.rest()
-		print(arm.servoinfo)
-	elif args.set:
-		if not re.match('^[0-9]*$', args.set[2]):
-			print('ERROR: time value must be an integer, not %s' % v)
-		arm.moveTo(args.set[0], args.set[1], int(args.set[2]))
-
-	if args.battery:
-		print('%d mV' % arm.getBattery())
-	elif args.read:
-		print(arm.read_pos())
+	try:
+		if args.daemon:
+			run_daemon(args.verbose, args.bulk)
+			sys.exit(0)
+
+		# use the daemon's open device if one is running
+		arm = ArmClient.connect()
+		if arm:
+			if args.verbose:
+				print('Connected to robarm daemon on %s' % SOCKPATH)
+		else:
+			arm = XArm(args.verbose, args.bulk)
+			if args.control:
+				arm.startWriter()
+		if args.control:
+			keycont = KeyControl(arm, args.kbd)
+			keycont.run()
+
+		if args.reset:
+			arm.rest()
+			print([arm.servoInfo(i+1) for i in range(6)])
+		elif args.set:
+			if not args.set[2].isdecimal():
+				print('ERROR: time value must be an integer, not %s' % args.set[2])
+				sys.exit(1)
+			arm.moveTo(args.set[0], args.set[1], int(args.set[2]))
+
+		if args.battery:
+			print('%d mV' % arm.getBattery())
+		elif args.read:
+			print(arm.read_pos())
+	except (ValueError, IOError) as e:
+		print('ERROR: %s' % e)
+		sys.exit(1)